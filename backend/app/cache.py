@@ -0,0 +1,41 @@
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+import logging
+import orjson
+import os
+
+logger = logging.getLogger(__name__)
+
+# Get Redis URL from environment variable; caching is disabled when unset
+REDIS_URL = os.getenv("REDIS_URL")
+
+redis = aioredis.from_url(REDIS_URL) if REDIS_URL else None
+
+async def get_cached(key: str):
+    """Return the cached JSON payload for key, or None on a miss"""
+    if redis is None:
+        return None
+    try:
+        data = await redis.get(key)
+    except RedisError:
+        logger.exception("Cache read failed for %s", key)
+        return None
+    return orjson.loads(data) if data is not None else None
+
+async def set_cached(key: str, value, ttl: int):
+    """Store a JSON-serializable payload under key for ttl seconds"""
+    if redis is None:
+        return
+    try:
+        await redis.set(key, orjson.dumps(value), ex=ttl)
+    except RedisError:
+        logger.exception("Cache write failed for %s", key)
+
+async def invalidate(*keys: str):
+    """Drop cached payloads after a write so readers see fresh data"""
+    if redis is None:
+        return
+    try:
+        await redis.delete(*keys)
+    except RedisError:
+        logger.exception("Cache invalidation failed for %s", keys)
\ No newline at end of file
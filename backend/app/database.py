@@ -1,20 +1,48 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from uuid import uuid4
 import os
 
 # Get database URL from environment variable or use default
-DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://localhost/patch_db")
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql+asyncpg://localhost/patch_db")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Connection pool sizing. The defaults (5 + 10 overflow) serialize requests
+# under load since every endpoint is DB-bound.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+
+# Set when connecting through PgBouncer in transaction mode. PgBouncer does
+# the pooling then, so each checkout opens a fresh client connection (NullPool),
+# and asyncpg's prepared statements get unique names and are never cached, since
+# the next transaction may run on a different server connection.
+PGBOUNCER = os.getenv("PGBOUNCER") is not None
+
+if PGBOUNCER:
+    engine_args = {
+        "poolclass": NullPool,
+        "connect_args": {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__"
+        }
+    }
+else:
+    engine_args = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": True,  # Drop connections closed by the server
+        "pool_recycle": 1800
+    }
+
+engine = create_async_engine(DATABASE_URL, **engine_args)
+# Keep attributes loaded after commit so handlers can return ORM objects
+# without triggering a lazy refresh outside of an awaited call
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close() 
\ No newline at end of file
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
\ No newline at end of file
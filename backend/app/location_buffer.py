@@ -0,0 +1,98 @@
+from sqlalchemy import update, values, column, or_, Integer, Float, DateTime
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+import asyncio
+import logging
+import os
+from .database import SessionLocal
+from .cache import invalidate
+from .models.user import User
+
+logger = logging.getLogger(__name__)
+
+# How often buffered locations are written to the database, in seconds
+LOCATION_FLUSH_INTERVAL = float(os.getenv("LOCATION_FLUSH_INTERVAL", "2"))
+
+# Users written per UPDATE; each takes 4 bind parameters and asyncpg allows 32767
+LOCATION_FLUSH_BATCH = 5000
+
+# Latest (latitude, longitude, timestamp) reported by each user since the last flush
+_loc_buffer: Dict[int, Tuple[float, float, datetime]] = {}
+
+# Locations taken out of _loc_buffer by a flush that has not finished yet
+_in_flight: Dict[int, Tuple[float, float, datetime]] = {}
+
+def buffer_location(user_id: int, latitude: float, longitude: float) -> datetime:
+    """Record a user's latest location for the next flush and return its timestamp"""
+    # Timezone-aware like the timestamptz column, so responses match stored values
+    timestamp = datetime.now(timezone.utc)
+    _loc_buffer[user_id] = (latitude, longitude, timestamp)
+    return timestamp
+
+def get_buffered_location(user_id: int) -> Optional[Tuple[float, float, datetime]]:
+    """Return a user's location that has not been written to the database yet, if any"""
+    return _loc_buffer.get(user_id) or _in_flight.get(user_id)
+
+async def flush_locations():
+    """Write all buffered locations with UPDATE ... FROM (VALUES ...), LOCATION_FLUSH_BATCH users at a time"""
+    global _loc_buffer, _in_flight
+    if not _loc_buffer:
+        return
+
+    pending, _loc_buffer = _loc_buffer, {}
+    _in_flight = pending
+    rows = [(user_id, lat, lng, ts) for user_id, (lat, lng, ts) in pending.items()]
+
+    try:
+        for start in range(0, len(rows), LOCATION_FLUSH_BATCH):
+            batch = rows[start:start + LOCATION_FLUSH_BATCH]
+            try:
+                await _write_locations(batch)
+            except BaseException as exc:
+                # Retry this batch and the unwritten ones on the next flush unless
+                # the user has reported a newer point since. Cancellation restores
+                # them too, so shutdown can still write them.
+                for user_id, lat, lng, ts in rows[start:]:
+                    _loc_buffer.setdefault(user_id, (lat, lng, ts))
+                if not isinstance(exc, Exception):
+                    raise
+                logger.exception("Failed to flush %d buffered locations", len(rows) - start)
+                return
+
+            await invalidate(*(f"user:{user_id}" for user_id, _, _, _ in batch))
+    finally:
+        _in_flight = {}
+
+async def _write_locations(rows):
+    """Apply one batch of (user_id, latitude, longitude, timestamp) rows"""
+    locations = values(
+        column("uid", Integer),
+        column("lat", Float),
+        column("lng", Float),
+        column("ts", DateTime(timezone=True)),
+        name="v"
+    ).data(rows)
+
+    async with SessionLocal() as db:
+        await db.execute(
+            update(User).where(
+                User.id == locations.c.uid,
+                # Never overwrite a newer point written by another worker
+                or_(User.last_location_update.is_(None), User.last_location_update < locations.c.ts)
+            ).values(
+                latitude=locations.c.lat,
+                longitude=locations.c.lng,
+                last_location_update=locations.c.ts
+            ).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+async def run_location_flusher():
+    """Flush buffered locations every LOCATION_FLUSH_INTERVAL seconds until cancelled"""
+    while True:
+        await asyncio.sleep(LOCATION_FLUSH_INTERVAL)
+        try:
+            await flush_locations()
+        except Exception:
+            # Keep flushing; one bad flush must not stop location updates for good
+            logger.exception("Location flush failed")
\ No newline at end of file
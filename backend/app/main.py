@@ -1,12 +1,48 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .database import engine, Base
+from .location_buffer import run_location_flusher, flush_locations
+from . import security
 from .routers import users, friends
+import asyncio
+import logging
+import os
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Configure logging once for the whole app; set LOG_LEVEL=DEBUG to also log
+# every location update
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 
-app = FastAPI(title="Patch API")
+app = FastAPI(title="Patch API", default_response_class=ORJSONResponse)
+
+# The schema is managed by setup_db.sh and the update_db_*.sh scripts. Set
+# AUTO_MIGRATE=1 in development to create any missing tables on startup.
+@app.on_event("startup")
+async def create_tables():
+    if not os.getenv("AUTO_MIGRATE"):
+        return
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+# Load the password hashers before the first login request needs them
+@app.on_event("startup")
+async def warm_up_password_hashing():
+    await users.run_password_hasher(security.warm_up_password_hashing)
+
+# Write buffered location updates to the database in the background
+@app.on_event("startup")
+async def start_location_flusher():
+    app.state.location_flusher = asyncio.create_task(run_location_flusher())
+
+@app.on_event("shutdown")
+async def stop_location_flusher():
+    # Let a flush in progress finish or put its batch back before the final flush
+    app.state.location_flusher.cancel()
+    try:
+        await app.state.location_flusher
+    except asyncio.CancelledError:
+        pass
+    await flush_locations()
 
 # Configure CORS
 app.add_middleware(
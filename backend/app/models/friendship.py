@@ -1,10 +1,24 @@
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Boolean, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from ..database import Base
 
 class Friendship(Base):
+    """A friend request from user_id to friend_id.
+
+    Once a request is accepted a mirror row (friend_id -> user_id) is stored as
+    well, so every accepted friendship can be found by filtering on user_id alone.
+    """
     __tablename__ = "friendships"
+    __table_args__ = (
+        # One row per direction; also the index behind add_friend/remove_friend pair lookups.
+        # Named like the constraint setup_db.sh creates so both schemas match.
+        UniqueConstraint("user_id", "friend_id", name="friendships_user_id_friend_id_key"),
+        # Friend lists filter on user_id and is_accepted and only read friend_id
+        Index("ix_friendships_user_id_is_accepted_friend_id", "user_id", "is_accepted", "friend_id"),
+        # Incoming friend requests filter on friend_id and is_accepted
+        Index("ix_friendships_friend_id_is_accepted", "friend_id", "is_accepted"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -15,4 +29,15 @@ class Friendship(Base):
 
     # Relationships
     user = relationship("User", foreign_keys=[user_id], back_populates="friendships")
-    friend = relationship("User", foreign_keys=[friend_id], back_populates="friend_of") 
\ No newline at end of file
+    friend = relationship("User", foreign_keys=[friend_id], back_populates="friend_of")
+
+# At most one pending request per unordered pair of users, whichever of them
+# sent it. Accepted friendships are excluded because they are stored in both
+# directions; UNIQUE (user_id, friend_id) covers requests between existing friends.
+Index(
+    "ix_friendships_pending_pair",
+    func.least(Friendship.user_id, Friendship.friend_id),
+    func.greatest(Friendship.user_id, Friendship.friend_id),
+    unique=True,
+    postgresql_where=(Friendship.is_accepted == False)
+)
\ No newline at end of file
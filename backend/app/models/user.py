@@ -1,11 +1,23 @@
-from sqlalchemy import Column, Integer, String, JSON, ForeignKey, DateTime, Float
+from sqlalchemy import Column, Integer, String, JSON, ForeignKey, DateTime, Float, Computed, Index
+from sqlalchemy.types import UserDefinedType
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from ..database import Base
 
+class Geography(UserDefinedType):
+    """PostGIS geography(Point, 4326) column"""
+    cache_ok = True
+    
+    def get_col_spec(self, **kw):
+        return "geography(Point,4326)"
+
 class User(Base):
     __tablename__ = "users"
-
+    __table_args__ = (
+        # Lets radius queries (ST_DWithin) prune candidates through the index
+        Index("users_location_gix", "location", postgresql_using="gist"),
+    )
+    
     id = Column(Integer, primary_key=True, index=True)
     phone_number = Column(String, unique=True, index=True, nullable=False)  # Phone number instead of email
     username = Column(String, unique=True, index=True, nullable=False)
@@ -23,9 +35,42 @@ class User(Base):
     latitude = Column(Float, nullable=True)  # User's last known latitude
     longitude = Column(Float, nullable=True)  # User's last known longitude
     last_location_update = Column(DateTime(timezone=True), nullable=True)  # When location was last updated
+    # Generated from latitude/longitude by the database; deferred so regular loads skip it
+    location = deferred(Column(Geography(), Computed("ST_MakePoint(longitude, latitude)::geography", persisted=True)))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
-    # Friendship relationships
-    friendships = relationship("Friendship", foreign_keys="Friendship.user_id", back_populates="user", cascade="all, delete-orphan")
-    friend_of = relationship("Friendship", foreign_keys="Friendship.friend_id", back_populates="friend", cascade="all, delete-orphan") 
\ No newline at end of file
+    # Friendship relationships (rows are removed by the database's ON DELETE CASCADE,
+    # so deleting a user never has to load these collections)
+    friendships = relationship("Friendship", foreign_keys="Friendship.user_id", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    friend_of = relationship("Friendship", foreign_keys="Friendship.friend_id", back_populates="friend", cascade="all, delete-orphan", passive_deletes=True)
+
+# Columns needed to build a UserSummary; list endpoints load only these
+USER_SUMMARY_COLUMNS = (
+    User.id,
+    User.username,
+    User.first_name,
+    User.last_name,
+    User.profile_picture,
+    User.latitude,
+    User.longitude,
+    User.last_location_update,
+)
+
+# Columns needed to build a UserPublic (everything but the password and timestamps)
+USER_PUBLIC_COLUMNS = (
+    User.id,
+    User.username,
+    User.phone_number,
+    User.first_name,
+    User.last_name,
+    User.interests,
+    User.school,
+    User.hometown,
+    User.job,
+    User.links,
+    User.profile_picture,
+    User.discovery_radius,
+    User.latitude,
+    User.longitude,
+)
\ No newline at end of file
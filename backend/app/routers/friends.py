@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import select, update, delete, exists, func, literal_column, or_, and_
 from typing import List
 from ..database import get_db
-from ..models.user import User
+from ..cache import get_cached, set_cached, invalidate
+from ..models.user import User, USER_SUMMARY_COLUMNS
 from ..models.friendship import Friendship
-from ..schemas.user import User as UserSchema
+from ..schemas.user import UserSummary
 from ..schemas.friendship import FriendRequest, FriendshipUpdate
 
 router = APIRouter(
@@ -13,208 +16,234 @@ router = APIRouter(
     tags=["friends"]
 )
 
-@router.get("/{user_id}/friends", response_model=List[UserSchema])
-def get_user_friends(user_id: int, db: Session = Depends(get_db)):
+# Searchable text for a user. This must stay identical to the expression
+# indexed by users_search_trgm_idx (see update_db_search_index.sh) so that
+# ILIKE '%query%' can use the trigram index instead of a sequential scan.
+USER_SEARCH_TEXT = (
+    User.username
+    + literal_column("' '") + func.coalesce(User.first_name, literal_column("''"))
+    + literal_column("' '") + func.coalesce(User.last_name, literal_column("''"))
+)
+
+@router.get("/{user_id}/friends", response_model=List[UserSummary])
+async def get_user_friends(user_id: int, db: AsyncSession = Depends(get_db)):
     """Get all friends for a user (both accepted and pending)"""
-    # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get all accepted friendships where the user is either the requester or the recipient
-    friendships = db.query(Friendship).filter(
-        or_(
-            and_(Friendship.user_id == user_id, Friendship.is_accepted == True),
-            and_(Friendship.friend_id == user_id, Friendship.is_accepted == True)
+    # Only the friend ids are cached. Friends' profiles and locations change far
+    # more often than the friend list, so their rows are always read fresh by
+    # primary key; a deleted friend simply drops out.
+    cache_key = f"friends:{user_id}"
+    friend_ids = await get_cached(cache_key)
+    if friend_ids is None:
+        # Check if user exists
+        user_exists = await db.scalar(select(exists().where(User.id == user_id)))
+        if not user_exists:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        # Accepted friendships are stored in both directions, so the user's own
+        # rows point at every friend
+        result = await db.scalars(
+            select(Friendship.friend_id).where(
+                Friendship.user_id == user_id,
+                Friendship.is_accepted == True
+            )
         )
-    ).all()
-    
-    # Extract friend IDs (the other user in each friendship)
-    friend_ids = []
-    for friendship in friendships:
-        if friendship.user_id == user_id:
-            friend_ids.append(friendship.friend_id)
-        else:
-            friend_ids.append(friendship.user_id)
+        friend_ids = result.all()
+        await set_cached(cache_key, friend_ids, ttl=60)
     
-    # Get all friend users
-    friends = db.query(User).filter(User.id.in_(friend_ids)).all()
+    if not friend_ids:
+        return []
     
-    return friends
+    result = await db.execute(
+        select(User).options(load_only(*USER_SUMMARY_COLUMNS)).where(User.id.in_(friend_ids))
+    )
+    return result.scalars().all()
 
 @router.post("/{user_id}/friends", status_code=status.HTTP_201_CREATED)
-def add_friend(user_id: int, friend_request: FriendRequest, db: Session = Depends(get_db)):
+async def add_friend(user_id: int, friend_request: FriendRequest, db: AsyncSession = Depends(get_db)):
     """Send a friend request"""
     # Check if both users exist
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    user_exists = await db.scalar(select(exists().where(User.id == user_id)))
+    if not user_exists:
         raise HTTPException(status_code=404, detail="User not found")
     
-    friend = db.query(User).filter(User.id == friend_request.friend_id).first()
-    if not friend:
+    friend_exists = await db.scalar(select(exists().where(User.id == friend_request.friend_id)))
+    if not friend_exists:
         raise HTTPException(status_code=404, detail="Friend not found")
     
-    # Check if friendship already exists
-    existing_friendship = db.query(Friendship).filter(
-        or_(
-            and_(Friendship.user_id == user_id, Friendship.friend_id == friend_request.friend_id),
-            and_(Friendship.user_id == friend_request.friend_id, Friendship.friend_id == user_id)
-        )
-    ).first()
+    # Create new friendship (friend request). The unique indexes on friendships
+    # reject a duplicate request for the pair in either direction, so there is no
+    # separate lookup and no race between checking and inserting.
+    result = await db.execute(
+        insert(Friendship).values(
+            user_id=user_id,
+            friend_id=friend_request.friend_id,
+            is_accepted=False  # Default is pending
+        ).on_conflict_do_nothing().returning(Friendship.id)
+    )
     
-    if existing_friendship:
+    if result.first() is None:
         raise HTTPException(status_code=400, detail="Friendship already exists")
     
-    # Create new friendship (friend request)
-    new_friendship = Friendship(
-        user_id=user_id,
-        friend_id=friend_request.friend_id,
-        is_accepted=False  # Default is pending
-    )
-    
-    db.add(new_friendship)
-    db.commit()
-    db.refresh(new_friendship)
+    await db.commit()
+    await invalidate(f"friend_requests:{friend_request.friend_id}")
     
     return {"message": "Friend request sent successfully"}
 
-@router.get("/{user_id}/friend-requests", response_model=List[UserSchema])
-def get_friend_requests(user_id: int, db: Session = Depends(get_db)):
+@router.get("/{user_id}/friend-requests", response_model=List[UserSummary])
+async def get_friend_requests(user_id: int, db: AsyncSession = Depends(get_db)):
     """Get all pending friend requests for a user"""
-    # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Get all pending friendships where the user is the recipient
-    pending_friendships = db.query(Friendship).filter(
-        Friendship.friend_id == user_id,
-        Friendship.is_accepted == False
-    ).all()
+    # Like the friend list, only (requester id, friendship id) pairs are
+    # cached and the requesters' rows are read fresh, so profile and location
+    # changes show up and a deleted requester drops out
+    cache_key = f"friend_requests:{user_id}"
+    pending = await get_cached(cache_key)
+    if pending is None:
+        # Check if user exists
+        user_exists = await db.scalar(select(exists().where(User.id == user_id)))
+        if not user_exists:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        # Get every requester along with the id of their pending friendship
+        result = await db.execute(
+            select(Friendship.user_id, Friendship.id).where(
+                Friendship.friend_id == user_id,
+                Friendship.is_accepted == False
+            )
+        )
+        pending = [list(row) for row in result.all()]
+        await set_cached(cache_key, pending, ttl=60)
     
-    # Extract requester IDs
-    requester_ids = [friendship.user_id for friendship in pending_friendships]
+    if not pending:
+        return []
     
-    # Get all requester users
-    requesters = db.query(User).filter(User.id.in_(requester_ids)).all()
+    friendship_ids = dict(pending)
+    result = await db.execute(
+        select(User).options(load_only(*USER_SUMMARY_COLUMNS)).where(User.id.in_(friendship_ids))
+    )
     
     # Enrich user objects with friendship_id
-    for i, user in enumerate(requesters):
-        # Find the corresponding friendship
-        for friendship in pending_friendships:
-            if friendship.user_id == user.id:
-                # Add friendship_id to the user object
-                setattr(user, "friendship_id", friendship.id)
-                break
+    requesters = []
+    for requester in result.scalars().all():
+        setattr(requester, "friendship_id", friendship_ids[requester.id])
+        requesters.append(requester)
     
     return requesters
 
-@router.get("/{user_id}/sent-friend-requests", response_model=List[UserSchema])
-def get_sent_friend_requests(user_id: int, db: Session = Depends(get_db)):
+@router.get("/{user_id}/sent-friend-requests", response_model=List[UserSummary])
+async def get_sent_friend_requests(user_id: int, db: AsyncSession = Depends(get_db)):
     """Get all friend requests sent by a user that are still pending"""
     # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
+    user_exists = await db.scalar(select(exists().where(User.id == user_id)))
+    if not user_exists:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Get all pending friendships where the user is the sender
-    sent_friendships = db.query(Friendship).filter(
-        Friendship.user_id == user_id,
-        Friendship.is_accepted == False
-    ).all()
-    
-    # Extract recipient IDs
-    recipient_ids = [friendship.friend_id for friendship in sent_friendships]
-    
-    # Get all recipient users
-    recipients = db.query(User).filter(User.id.in_(recipient_ids)).all()
+    # Get all recipient users along with the id of their pending friendship
+    result = await db.execute(
+        select(User, Friendship.id).options(load_only(*USER_SUMMARY_COLUMNS)).join(
+            Friendship, Friendship.friend_id == User.id
+        ).where(
+            Friendship.user_id == user_id,
+            Friendship.is_accepted == False
+        )
+    )
     
     # Enrich user objects with friendship_id
-    for i, recipient in enumerate(recipients):
-        # Find the corresponding friendship
-        for friendship in sent_friendships:
-            if friendship.friend_id == recipient.id:
-                # Add friendship_id to the user object
-                setattr(recipient, "friendship_id", friendship.id)
-                break
+    recipients = []
+    for recipient, friendship_id in result.all():
+        setattr(recipient, "friendship_id", friendship_id)
+        recipients.append(recipient)
     
     return recipients
 
 @router.put("/{user_id}/friend-requests/{friendship_id}", status_code=status.HTTP_200_OK)
-def respond_to_friend_request(
-    user_id: int, 
-    friendship_id: int, 
-    response: FriendshipUpdate, 
-    db: Session = Depends(get_db)
+async def respond_to_friend_request(
+    user_id: int,
+    friendship_id: int,
+    response: FriendshipUpdate,
+    db: AsyncSession = Depends(get_db)
 ):
     """Accept or reject a friend request"""
-    # Check if user exists
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Check if friendship exists and user is the recipient
-    friendship = db.query(Friendship).filter(
+    # Only a pending request addressed to this user can be answered; an unknown
+    # user or friendship simply matches no rows
+    pending_request = and_(
         Friendship.id == friendship_id,
-        Friendship.friend_id == user_id
-    ).first()
-    
-    if not friendship:
-        raise HTTPException(status_code=404, detail="Friend request not found")
+        Friendship.friend_id == user_id,
+        Friendship.is_accepted == False
+    )
     
     if response.is_accepted:
-        # Accept the friend request
-        friendship.is_accepted = True
-        db.commit()
+        # Accept the friend request and store the reverse direction too
+        result = await db.execute(
+            update(Friendship).where(pending_request).values(is_accepted=True).returning(Friendship.user_id)
+        )
+        requester_id = result.scalar_one_or_none()
+        if requester_id is None:
+            raise HTTPException(status_code=404, detail="Friend request not found")
+        
+        db.add(Friendship(
+            user_id=user_id,
+            friend_id=requester_id,
+            is_accepted=True
+        ))
+        await db.commit()
+        await invalidate(f"friend_requests:{user_id}", f"friends:{user_id}", f"friends:{requester_id}")
         return {"message": "Friend request accepted"}
     else:
         # Reject the friend request (delete it)
-        db.delete(friendship)
-        db.commit()
+        result = await db.execute(delete(Friendship).where(pending_request))
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Friend request not found")
+        
+        await db.commit()
+        await invalidate(f"friend_requests:{user_id}")
         return {"message": "Friend request rejected"}
 
 @router.delete("/{user_id}/friends/{friend_id}", status_code=status.HTTP_200_OK)
-def remove_friend(user_id: int, friend_id: int, db: Session = Depends(get_db)):
+async def remove_friend(user_id: int, friend_id: int, db: AsyncSession = Depends(get_db)):
     """Remove a friend"""
-    # Check if both users exist
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    friend = db.query(User).filter(User.id == friend_id).first()
-    if not friend:
-        raise HTTPException(status_code=404, detail="Friend not found")
-    
-    # Check if friendship exists
-    friendship = db.query(Friendship).filter(
-        or_(
-            and_(Friendship.user_id == user_id, Friendship.friend_id == friend_id),
-            and_(Friendship.user_id == friend_id, Friendship.friend_id == user_id)
+    # Delete the friendship in both directions (an accepted friendship has a
+    # row in each); an unknown user or friendship simply matches no rows
+    result = await db.execute(
+        delete(Friendship).where(
+            or_(
+                and_(Friendship.user_id == user_id, Friendship.friend_id == friend_id),
+                and_(Friendship.user_id == friend_id, Friendship.friend_id == user_id)
+            )
         )
-    ).first()
+    )
     
-    if not friendship:
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Friendship not found")
     
-    # Delete the friendship
-    db.delete(friendship)
-    db.commit()
+    await db.commit()
+    await invalidate(
+        f"friends:{user_id}", f"friends:{friend_id}",
+        f"friend_requests:{user_id}", f"friend_requests:{friend_id}"
+    )
     
     return {"message": "Friend removed successfully"}
 
-@router.get("/search", response_model=List[UserSchema])
-def search_users(query: str, db: Session = Depends(get_db)):
+@router.get("/search", response_model=List[UserSummary])
+async def search_users(query: str, db: AsyncSession = Depends(get_db)):
     """Search for users by username or name"""
     if len(query) < 2:
         raise HTTPException(status_code=400, detail="Search query must be at least 2 characters")
     
-    # Search by username, first name, or last name
-    users = db.query(User).filter(
-        or_(
-            User.username.ilike(f"%{query}%"),
-            User.first_name.ilike(f"%{query}%"),
-            User.last_name.ilike(f"%{query}%")
-        )
-    ).limit(10).all()
-    
-    return users 
\ No newline at end of file
+    # Only the matching ids are cached. The rows are read fresh and matched
+    # again, so a renamed or deleted user drops out and locations are current.
+    search_text = USER_SEARCH_TEXT.ilike(f"%{query}%")
+    cache_key = f"search:{query.lower()}"
+    user_ids = await get_cached(cache_key)
+    if user_ids is None:
+        # Search by username, first name, or last name
+        result = await db.scalars(select(User.id).where(search_text).limit(10))
+        user_ids = result.all()
+        await set_cached(cache_key, user_ids, ttl=30)
+    
+    if not user_ids:
+        return []
+    
+    result = await db.execute(
+        select(User).options(load_only(*USER_SUMMARY_COLUMNS)).where(User.id.in_(user_ids), search_text)
+    )
+    return result.scalars().all()
\ No newline at end of file
@@ -1,19 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Body
-from sqlalchemy.orm import Session
-from typing import List, Dict
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from typing import List
 from ..database import get_db
-from ..models.user import User
-from ..schemas.user import UserCreate, User as UserSchema, UserUpdate, UserLogin, ContactsCheck
-from passlib.context import CryptContext
+from ..cache import get_cached, set_cached, invalidate
+from ..location_buffer import buffer_location, get_buffered_location
+from ..security import get_password_hash, get_cached_verify_result, cached_verify_and_update_password, DUMMY_HASH
+from ..utils.geo import haversine_miles_arr
+from ..models.user import User, Geography, USER_SUMMARY_COLUMNS, USER_PUBLIC_COLUMNS
+from ..schemas.user import UserCreate, User as UserSchema, UserSummary, NearbyUser, UserPublic, UserUpdate, UserLogin, UserLocationUpdate, ContactsCheck
 from datetime import datetime
 import logging
-import re
-from sqlalchemy import func
-import math
+import anyio
+import os
+from sqlalchemy import select, insert, update, delete, exists, func, cast, literal, any_, or_, and_, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import IntegrityError
+import numpy as np
 from ..models.friendship import Friendship
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(
@@ -21,352 +26,411 @@ router = APIRouter(
     tags=["users"]
 )
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+METERS_PER_MILE = 1609.344
 
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
+# ST_DWithin measures on the WGS84 spheroid while haversine_miles_arr uses a
+# sphere; widen the SQL prefilter so it never drops a user the exact check keeps
+PREFILTER_MARGIN = 1.01
 
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+# Columns find_nearby_contacts reads for candidates and for direct contacts
+NEARBY_COLS = (
+    User.id, User.latitude, User.longitude, User.discovery_radius, User.username,
+    User.first_name, User.last_name, User.phone_number, User.profile_picture
+)
+CONTACT_COLS = (User.id, User.username, User.first_name, User.last_name, User.phone_number)
 
-def normalize_phone_number(phone_number: str) -> str:
-    """Normalize phone number to E.164 format"""
-    # Remove any non-digit characters
-    phone = re.sub(r'\D', '', phone_number)
-    
-    # Format as E.164 standard: +[country code][number]
-    # For simplicity, assuming US/Canada numbers if no country code
-    if not phone.startswith('1') and len(phone) == 10:
-        phone = '1' + phone
-        
-    return '+' + phone
+# Password hashing runs in worker threads, at most one per CPU core, so a burst
+# of logins queues here instead of filling the threadpool shared with the rest
+# of the app. Created on first use because it must be made inside the event loop.
+_hash_limiter = None
+
+async def run_password_hasher(hasher, *args):
+    """Run a password hashing function in a worker thread, bounded by the CPU count"""
+    global _hash_limiter
+    if _hash_limiter is None:
+        _hash_limiter = anyio.CapacityLimiter(os.cpu_count() or 1)
+    return await anyio.to_thread.run_sync(hasher, *args, limiter=_hash_limiter)
 
-# Calculate distance between two points using Haversine formula
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points in miles"""
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    r = 3956  # Radius of earth in miles
-    return c * r
+def geography_point(latitude: float, longitude: float):
+    """SQL expression for a point comparable with User.location"""
+    return cast(func.ST_MakePoint(longitude, latitude), Geography())
 
-@router.post("/login")
-def login(user_data: UserLogin, db: Session = Depends(get_db)):
+def current_user_location(user_id: int, current_user):
+    """Return the user's latest point: one still waiting in the location buffer, else the stored one"""
+    buffered = get_buffered_location(user_id)
+    if buffered is not None:
+        return buffered[0], buffered[1]
+    return current_user.latitude, current_user.longitude
+
+@router.post("/login", response_model=UserPublic)
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     # Find user by username
-    user = db.query(User).filter(User.username == user_data.username).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password"
-        )
+    result = await db.execute(select(User).where(User.username == user_data.username))
+    user = result.scalar_one_or_none()
     
-    # Verify password
-    if not verify_password(user_data.password, user.password):
+    # Verify password. An unknown username still pays for a hash so response
+    # times don't reveal which usernames exist.
+    # A repeat of a recent attempt is answered from the cache without waiting
+    # for a hashing thread.
+    candidate_hash = user.password if user else DUMMY_HASH
+    result = get_cached_verify_result(user_data.username, user_data.password, candidate_hash)
+    if result is None:
+        result = await run_password_hasher(
+            cached_verify_and_update_password, user_data.username, user_data.password, candidate_hash
+        )
+    verified, new_hash = result
+    if not user or not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     
-    logger.info(f"User logged in: {user.id} - {user.username}")
+    # Upgrade legacy bcrypt hashes now that we know the plain password
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+    
+    logger.info("User logged in: %d - %s", user.id, user.username)
     
     # Return user data (excluding password)
-    return {
-        "id": user.id,
-        "username": user.username,
-        "phone_number": user.phone_number,
-        "first_name": user.first_name,
-        "last_name": user.last_name,
-        "interests": user.interests,
-        "school": user.school,
-        "hometown": user.hometown,
-        "job": user.job,
-        "links": user.links,
-        "profile_picture": user.profile_picture,
-        "discovery_radius": user.discovery_radius,
-        "latitude": user.latitude,
-        "longitude": user.longitude
-    }
+    return UserPublic.model_validate(user)
 
-@router.post("/register")
-def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
-    # Check if username already exists
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
-    if existing_user:
+@router.post("/register", response_model=UserPublic)
+async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
+    # Check if the username or phone number is taken in one query, before
+    # spending time on hashing the password
+    result = await db.execute(select(
+        exists().where(User.username == user_data.username),
+        exists().where(User.phone_number == user_data.phone_number)
+    ))
+    username_taken, phone_taken = result.one()
+    if username_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
     
-    # Check if phone number already exists
-    existing_user = db.query(User).filter(User.phone_number == user_data.phone_number).first()
-    if existing_user:
+    if phone_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Phone number already registered"
         )
     
-    # Create new user
-    hashed_password = get_password_hash(user_data.password)
-    db_user = User(
-        phone_number=user_data.phone_number,
-        username=user_data.username,
-        first_name=user_data.first_name,
-        last_name=user_data.last_name,
-        password=hashed_password,
-        interests=user_data.interests,
-        school=user_data.school,
-        hometown=user_data.hometown,
-        job=user_data.job,
-        links=user_data.links,
-        profile_picture=user_data.profile_picture,
-        discovery_radius=user_data.discovery_radius,
-        latitude=user_data.latitude,
-        longitude=user_data.longitude,
-        last_location_update=datetime.now() if user_data.latitude and user_data.longitude else None
-    )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    # Create new user and get the row back from the same INSERT
+    hashed_password = await run_password_hasher(get_password_hash, user_data.password)
+    try:
+        result = await db.execute(
+            insert(User).values(
+                phone_number=user_data.phone_number,
+                username=user_data.username,
+                first_name=user_data.first_name,
+                last_name=user_data.last_name,
+                password=hashed_password,
+                interests=user_data.interests,
+                school=user_data.school,
+                hometown=user_data.hometown,
+                job=user_data.job,
+                links=user_data.links,
+                profile_picture=user_data.profile_picture,
+                discovery_radius=user_data.discovery_radius,
+                latitude=user_data.latitude,
+                longitude=user_data.longitude,
+                last_location_update=datetime.now() if user_data.latitude and user_data.longitude else None
+            ).returning(*USER_PUBLIC_COLUMNS)
+        )
+        db_user = result.one()
+        await db.commit()
+    except IntegrityError:
+        # Another registration took the username or phone number after the check
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or phone number already registered"
+        )
     
-    logger.info(f"New user registered: {db_user.id} - {db_user.username}")
+    logger.info("New user registered: %d - %s", db_user.id, db_user.username)
     
     # Return user data (excluding password) similar to login
-    return {
-        "id": db_user.id,
-        "username": db_user.username,
-        "phone_number": db_user.phone_number,
-        "first_name": db_user.first_name,
-        "last_name": db_user.last_name,
-        "interests": db_user.interests,
-        "school": db_user.school,
-        "hometown": db_user.hometown,
-        "job": db_user.job,
-        "links": db_user.links,
-        "profile_picture": db_user.profile_picture,
-        "discovery_radius": db_user.discovery_radius,
-        "latitude": db_user.latitude,
-        "longitude": db_user.longitude
-    }
+    return UserPublic.model_validate(db_user)
 
 @router.post("/contacts/check")
-def check_contacts(contact_data: ContactsCheck, db: Session = Depends(get_db)):
+async def check_contacts(contact_data: ContactsCheck, db: AsyncSession = Depends(get_db)):
     """Check which phone numbers from contacts are registered users"""
-    # Normalize all phone numbers
-    normalized_numbers = [normalize_phone_number(phone) for phone in contact_data.phone_numbers]
+    # Numbers arrive normalized by ContactsCheck; drop duplicates (address
+    # books often list the same number several times)
+    normalized_numbers = list(dict.fromkeys(contact_data.phone_numbers))
     
-    # Find users with matching phone numbers
-    registered_users = db.query(User).filter(User.phone_number.in_(normalized_numbers)).all()
+    # Find users with matching phone numbers. The numbers are sent as a single
+    # array parameter and joined against, so a large contact list is one bind
+    # value and Postgres can hash-join it with users instead of expanding IN (...)
+    # render_derived() emits the column alias (AS anon_1(phone)) Postgres needs
+    phones = func.unnest(literal(normalized_numbers, ARRAY(String))).table_valued("phone").render_derived()
+    result = await db.execute(
+        select(User.id, User.phone_number, User.username, User.first_name, User.last_name).join(
+            phones, User.phone_number == phones.c.phone
+        )
+    )
     
-    # Create a map of phone number to user data
-    result = {}
-    for user in registered_users:
-        result[user.phone_number] = {
-            "id": user.id,
-            "username": user.username,
-            "first_name": user.first_name,
-            "last_name": user.last_name,
-            "is_registered": True
-        }
+    users_by_phone = {user.phone_number: user for user in result.all()}
     
-    # Add non-registered numbers
+    # Create a map of phone number to user data, marking non-registered numbers
+    contacts = {}
     for phone in normalized_numbers:
-        if phone not in result:
-            result[phone] = {
+        user = users_by_phone.get(phone)
+        if user is None:
+            contacts[phone] = {
                 "is_registered": False
             }
+        else:
+            contacts[phone] = {
+                "id": user.id,
+                "username": user.username,
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "is_registered": True
+            }
     
-    return result
+    return contacts
 
-@router.get("/", response_model=List[UserSchema])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = db.query(User).offset(skip).limit(limit).all()
+@router.get("/", response_model=List[UserSummary])
+async def read_users(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(
+        select(User).options(load_only(*USER_SUMMARY_COLUMNS)).offset(skip).limit(limit)
+    )
+    users = result.scalars().all()
     return users
 
 @router.get("/{user_id}", response_model=UserSchema)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+async def read_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    cache_key = f"user:{user_id}"
+    user_data = await get_cached(cache_key)
+    if user_data is None:
+        db_user = await db.get(User, user_id)
+        if db_user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        user_data = UserSchema.model_validate(db_user).model_dump(mode="json")
+        await set_cached(cache_key, user_data, ttl=60)
+    
+    # A location update that has not been flushed yet is newer than the stored one
+    buffered = get_buffered_location(user_id)
+    if buffered is not None:
+        latitude, longitude, last_location_update = buffered
+        user_data = {
+            **user_data,
+            "latitude": latitude,
+            "longitude": longitude,
+            "last_location_update": last_location_update
+        }
+    return user_data
 
 @router.put("/{user_id}", response_model=UserSchema)
-def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+async def update_user(user_id: int, user: UserUpdate, db: AsyncSession = Depends(get_db)):
     # Update user fields
     update_data = user.model_dump(exclude_unset=True)
     if "password" in update_data:
-        update_data["password"] = get_password_hash(update_data["password"])
+        update_data["password"] = await run_password_hasher(get_password_hash, update_data["password"])
     
     # If location is being updated, set the last_location_update timestamp
     if "latitude" in update_data or "longitude" in update_data:
         update_data["last_location_update"] = datetime.now()
     
-    for key, value in update_data.items():
-        setattr(db_user, key, value)
+    # Apply the update and read back the row in a single UPDATE ... RETURNING
+    result = await db.execute(
+        update(User).where(User.id == user_id).values(**update_data).returning(User)
+    )
+    db_user = result.scalar_one_or_none()
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
     
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await invalidate(f"user:{user_id}")
     return db_user
 
 @router.patch("/{user_id}/location")
-def update_user_location(
-    request: Request,
+async def update_user_location(
     user_id: int,
-    location_data: Dict[str, float] = Body(...),
-    db: Session = Depends(get_db)
+    location_data: UserLocationUpdate,
+    db: AsyncSession = Depends(get_db)
 ):
-    logger.info(f"Location update request for user {user_id}")
-    logger.info(f"Request headers: {request.headers}")
-    logger.info(f"Location data: {location_data}")
+    logger.debug("Location update request for user %d", user_id)
     
     # Check if the user exists
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if db_user is None:
-        logger.error(f"User {user_id} not found")
+    user_exists = await db.scalar(select(exists().where(User.id == user_id)))
+    if not user_exists:
+        logger.error("User %d not found", user_id)
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Update location data
-    if "latitude" in location_data and "longitude" in location_data:
-        db_user.latitude = location_data["latitude"]
-        db_user.longitude = location_data["longitude"]
-        db_user.last_location_update = datetime.now()
-        
-        db.commit()
-        db.refresh(db_user)
-        
-        logger.info(f"Location updated for user {user_id}: lat={db_user.latitude}, lng={db_user.longitude}")
-        
-        return {
-            "id": db_user.id,
-            "latitude": db_user.latitude,
-            "longitude": db_user.longitude,
-            "last_location_update": db_user.last_location_update
-        }
-    else:
-        logger.error(f"Invalid location data for user {user_id}: {location_data}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Both latitude and longitude are required"
-        )
+    # Update location data. Points are buffered in memory and written in
+    # batches by the location flusher, so a ping costs no write transaction.
+    last_location_update = buffer_location(user_id, location_data.latitude, location_data.longitude)
+    
+    logger.debug("Location updated for user %d: lat=%s, lng=%s", user_id, location_data.latitude, location_data.longitude)
+    
+    return {
+        "id": user_id,
+        "latitude": location_data.latitude,
+        "longitude": location_data.longitude,
+        "last_location_update": last_location_update
+    }
 
 @router.delete("/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if db_user is None:
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    # Friendships are removed by the database's ON DELETE CASCADE, so the user
+    # row can be deleted without loading it first
+    result = await db.execute(delete(User).where(User.id == user_id))
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
-    db.delete(db_user)
-    db.commit()
+    await db.commit()
+    await invalidate(f"user:{user_id}", f"friends:{user_id}", f"friend_requests:{user_id}")
     return {"message": "User deleted successfully"}
 
 @router.post("/{user_id}/nearby-contacts")
-def find_nearby_contacts(
+async def find_nearby_contacts(
     user_id: int, 
     contact_data: ContactsCheck,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Find users who share mutual contacts with the given user and are within discovery radius"""
-    # Get the current user
-    current_user = db.query(User).filter(User.id == user_id).first()
+    # Get the current user's location and radius
+    result = await db.execute(
+        select(User.latitude, User.longitude, User.discovery_radius).where(User.id == user_id)
+    )
+    current_user = result.first()
     if not current_user:
         raise HTTPException(status_code=404, detail="User not found")
+    latitude, longitude = current_user_location(user_id, current_user)
     
     # Check if user has location data
-    if not current_user.latitude or not current_user.longitude:
+    if not latitude or not longitude:
         raise HTTPException(
             status_code=400, 
             detail="Location data not available. Please update your location."
         )
     
-    # Normalize all phone numbers from the request
-    normalized_numbers = [normalize_phone_number(phone) for phone in contact_data.phone_numbers]
+    # Numbers arrive normalized by ContactsCheck; drop duplicates. They are
+    # bound as one array parameter rather than an IN (...) list of every number.
+    normalized_numbers = list(dict.fromkeys(contact_data.phone_numbers))
+    phone_array = literal(normalized_numbers, ARRAY(String))
     
     # Find users with matching phone numbers - these are the user's direct contacts
-    direct_contacts = db.query(User).filter(
-        User.phone_number.in_(normalized_numbers),
-        User.id != user_id  # Exclude the current user
-    ).all()
+    result = await db.execute(
+        select(*CONTACT_COLS).where(
+            User.phone_number == any_(phone_array),
+            User.id != user_id  # Exclude the current user
+        )
+    )
+    direct_contacts = result.all()
     
     # Create a set of user IDs who are direct contacts
     direct_contact_ids = {user.id for user in direct_contacts}
-    direct_contact_phones = {user.phone_number for user in direct_contacts}
-    
-    # Get existing friendships to exclude them
-    existing_friendships = db.query(Friendship).filter(
-        (Friendship.user_id == user_id) | (Friendship.friend_id == user_id)
-    ).all()
-    
-    # Create a set of user IDs who are already friends
-    friend_ids = set()
-    for friendship in existing_friendships:
-        if friendship.user_id == user_id:
-            friend_ids.add(friendship.friend_id)
-        else:
-            friend_ids.add(friendship.user_id)
-    
-    # Find all users who might be nearby
-    potential_nearby_users = db.query(User).filter(
-        User.id != user_id,
-        User.latitude.isnot(None),
-        User.longitude.isnot(None),
-        ~User.id.in_(friend_ids),  # Exclude friends
-        ~User.id.in_(direct_contact_ids),  # Exclude direct contacts
-        ~User.phone_number.in_(normalized_numbers)  # Make sure they're not in the user's contacts
-    ).all()
+    
+    # Find all users who might be nearby. ST_DWithin uses the GIST index on
+    # location (a bounding-box search) to skip users outside the user's
+    # discovery radius, and the second check drops users outside their own
+    # radius before they are sent back; the exact distance check below still
+    # decides who is returned.
+    # Exclusions are checked with NOT EXISTS, which Postgres runs as an anti-join
+    # instead of comparing every row to a NOT IN list. Existing friendships and
+    # requests (in either direction) are matched in the database directly, so
+    # they never have to be fetched.
+    is_friend = exists().where(or_(
+        and_(Friendship.user_id == user_id, Friendship.friend_id == User.id),
+        and_(Friendship.friend_id == user_id, Friendship.user_id == User.id)
+    ))
+    # render_derived() emits the column aliases (AS anon_1(id)) Postgres needs
+    excluded_ids = func.unnest(literal(list(direct_contact_ids), ARRAY(Integer))).table_valued("id").render_derived()
+    contact_phones = func.unnest(phone_array).table_valued("phone").render_derived()
+    me = geography_point(latitude, longitude)
+    result = await db.execute(
+        select(*NEARBY_COLS).where(
+            User.id != user_id,
+            func.ST_DWithin(User.location, me, current_user.discovery_radius * METERS_PER_MILE * PREFILTER_MARGIN),
+            func.ST_DWithin(User.location, me, User.discovery_radius * METERS_PER_MILE * PREFILTER_MARGIN),
+            ~is_friend,  # Exclude friends
+            ~exists().where(excluded_ids.c.id == User.id),  # Exclude direct contacts
+            ~exists().where(contact_phones.c.phone == User.phone_number)  # Make sure they're not in the user's contacts
+        )
+    )
+    potential_nearby_users = result.all()
+    
+    # In a real app, we'd query a contacts table to find which of the user's
+    # direct contacts also have each nearby user in their contacts. For this demo
+    # we assume mutual contacts exist if they're both registered users, so every
+    # nearby user shares all of the user's direct contacts.
+    shared_contacts = [
+        {
+            "id": contact.id,
+            "name": f"{contact.first_name} {contact.last_name}" if contact.first_name and contact.last_name else contact.username,
+            "username": contact.username
+        }
+        for contact in direct_contacts
+    ]
+    if not shared_contacts or not potential_nearby_users:
+        return []
+    
+    # Calculate all distances at once
+    count = len(potential_nearby_users)
+    lats = np.fromiter((user.latitude for user in potential_nearby_users), dtype=np.float64, count=count)
+    lons = np.fromiter((user.longitude for user in potential_nearby_users), dtype=np.float64, count=count)
+    radii = np.fromiter((user.discovery_radius for user in potential_nearby_users), dtype=np.float64, count=count)
+    distances = haversine_miles_arr(latitude, longitude, lats, lons)
+    
+    # Check if within discovery radius (use the smaller of the two radiuses)
+    within_radius = distances <= np.minimum(current_user.discovery_radius, radii)
     
     # Find nearby users with shared contacts
     nearby_users = []
+    for index in np.flatnonzero(within_radius):
+        user = potential_nearby_users[index]
+        nearby_users.append({
+            "id": user.id,
+            "username": user.username,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "distance": round(float(distances[index]), 1),
+            "phone_number": user.phone_number,
+            "profile_picture": user.profile_picture,
+            "mutual_contacts": shared_contacts
+        })
+    
+    return nearby_users
+
+@router.get("/{user_id}/nearby", response_model=List[NearbyUser])
+async def find_nearby_users(user_id: int, limit: int = 50, db: AsyncSession = Depends(get_db)):
+    """Find users within both their own and the given user's discovery radius, closest first"""
+    result = await db.execute(
+        select(User.latitude, User.longitude, User.discovery_radius).where(User.id == user_id)
+    )
+    current_user = result.first()
+    if not current_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    latitude, longitude = current_user_location(user_id, current_user)
     
-    for user in potential_nearby_users:
-        # Calculate distance
-        distance = calculate_distance(
-            current_user.latitude, current_user.longitude,
-            user.latitude, user.longitude
+    # Check if user has location data
+    if latitude is None or longitude is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Location data not available. Please update your location."
         )
-        
-        # Check if within discovery radius (use the smaller of the two radiuses)
-        max_distance = min(current_user.discovery_radius, user.discovery_radius)
-        
-        if distance <= max_distance:
-            # Now we need to find if this user has any contacts in common with the current user
-            # For this demo, we'll check if this user is in the contacts of any of the user's direct contacts
-            
-            # Get all users who have this user's phone number in their contacts
-            # In a real app, we'd query a contacts table, but for this demo, we'll assume
-            # that if A has B's number, then B has A's number
-            
-            # Check if this user is a contact of any of the user's direct contacts
-            shared_contacts = []
-            
-            for contact in direct_contacts:
-                # In a real app, you'd check a contacts database
-                # For now, we'll just assume mutual contacts exist if they're both registered users
-                # This is a simplification for the demo
-                shared_contacts.append({
-                    "id": contact.id,
-                    "name": f"{contact.first_name} {contact.last_name}" if contact.first_name and contact.last_name else contact.username,
-                    "username": contact.username
-                })
-            
-            if shared_contacts:
-                nearby_users.append({
-                    "id": user.id,
-                    "username": user.username,
-                    "first_name": user.first_name,
-                    "last_name": user.last_name,
-                    "distance": round(distance, 1),
-                    "phone_number": user.phone_number,
-                    "profile_picture": user.profile_picture,
-                    "mutual_contacts": shared_contacts
-                })
-    
-    return nearby_users 
\ No newline at end of file
+    
+    # ST_DWithin on the indexed location column prunes candidates to the user's
+    # radius; the distance check then applies the smaller of the two radiuses
+    me = geography_point(latitude, longitude)
+    radius_meters = current_user.discovery_radius * METERS_PER_MILE
+    distance = func.ST_Distance(User.location, me)
+    result = await db.execute(
+        select(User, distance).options(load_only(*USER_SUMMARY_COLUMNS)).where(
+            User.id != user_id,
+            func.ST_DWithin(User.location, me, radius_meters),
+            distance <= User.discovery_radius * METERS_PER_MILE
+        ).order_by(distance).limit(limit)
+    )
+    
+    nearby_users = []
+    for user, distance_meters in result.all():
+        setattr(user, "distance", round(distance_meters / METERS_PER_MILE, 1))
+        nearby_users.append(user)
+    
+    return nearby_users
\ No newline at end of file
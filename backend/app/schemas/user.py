@@ -1,11 +1,27 @@
 from pydantic import BaseModel, validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
+from ..security import normalize_phone_number, normalize_phone_batch
 import re
 
 # Only these keys are allowed in links
 SOCIAL_KEYS = ["instagram", "snapchat", "spotify", "linkedin", "github"]
 
+# Accepted phone number format: optional leading + and 10 to 15 digits
+_PHONE_RE = re.compile(r'^\+?[0-9]{10,15}$')
+# Phone number as typed by a user: digits with optional +, spaces, dots, dashes and parentheses
+_PHONE_INPUT_RE = re.compile(r'^\+?[0-9 ().\-]+$')
+
+def _canonical_phone_number(v: str) -> str:
+    """Validate a phone number as typed and return it in E.164 format (+15551234567)"""
+    if not _PHONE_INPUT_RE.match(v):
+        raise ValueError('Invalid phone number format')
+    
+    phone = normalize_phone_number(v)
+    if not _PHONE_RE.match(phone):
+        raise ValueError('Invalid phone number format')
+    return phone
+
 class UserBase(BaseModel):
     phone_number: str
     username: str
@@ -25,12 +41,17 @@ class UserBase(BaseModel):
     @validator('phone_number')
     def validate_phone_number(cls, v):
         # Simple validation for phone number format
-        if not re.match(r'^\+?[0-9]{10,15}$', v):
+        if not _PHONE_RE.match(v):
             raise ValueError('Invalid phone number format')
         return v
 
 class UserCreate(UserBase):
     password: str
+    
+    @validator('phone_number')
+    def validate_phone_number(cls, v):
+        # Store phone numbers in the same E.164 form contacts are matched in
+        return _canonical_phone_number(v)
 
 class UserUpdate(BaseModel):
     phone_number: Optional[str] = None
@@ -54,10 +75,8 @@ class UserUpdate(BaseModel):
         if v is None:
             return v
             
-        # Simple validation for phone number format
-        if not re.match(r'^\+?[0-9]{10,15}$', v):
-            raise ValueError('Invalid phone number format')
-        return v
+        # Store phone numbers in the same E.164 form contacts are matched in
+        return _canonical_phone_number(v)
 
 class User(UserBase):
     id: int
@@ -69,6 +88,44 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class UserSummary(BaseModel):
+    """Slim user data for list endpoints (friends, requests, search)"""
+    id: int
+    username: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    profile_picture: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    last_location_update: Optional[datetime] = None
+    friendship_id: Optional[int] = None  # For friend requests
+
+    class Config:
+        from_attributes = True
+
+class NearbyUser(UserSummary):
+    distance: float  # Distance from the requesting user in miles
+
+class UserPublic(BaseModel):
+    """User data returned by login and registration (excludes password)"""
+    id: int
+    username: str
+    phone_number: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    interests: List[str] = []
+    school: Optional[str] = None
+    hometown: Optional[str] = None
+    job: Optional[str] = None
+    links: Dict[str, str] = {}
+    profile_picture: Optional[str] = None
+    discovery_radius: Optional[float] = 10
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
 class UserLogin(BaseModel):
     username: str
     password: str
@@ -78,4 +135,9 @@ class UserLocationUpdate(BaseModel):
     longitude: float
 
 class ContactsCheck(BaseModel):
-    phone_numbers: List[str] 
\ No newline at end of file
+    phone_numbers: List[str]
+    
+    @validator('phone_numbers')
+    def normalize_phone_numbers(cls, v):
+        # Normalized once at parse time, so handlers get E.164 numbers
+        return normalize_phone_batch(v) 
\ No newline at end of file
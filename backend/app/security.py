@@ -0,0 +1,104 @@
+from passlib.context import CryptContext
+from cachetools import TTLCache
+from typing import List
+import hashlib
+import threading
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Matches runs of characters other than ASCII 0-9 in a phone number. Unlike
+# \D this also strips non-ASCII digits, which E.164 numbers cannot contain.
+_NON_DIGIT = re.compile(r'[^0-9]+', re.ASCII)
+# Same, but keeps the newlines that separate numbers in a batch
+_NON_DIGIT_OR_NEWLINE = re.compile(r'[^0-9\n]+', re.ASCII)
+
+# Password hashing: new hashes use argon2id, existing bcrypt hashes are still
+# accepted and re-hashed with argon2id on the user's next successful login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1
+)
+
+def warm_up_password_hashing():
+    """Load the hashing backends and run one hash so the first logins after a restart are not slowed down"""
+    pwd_context.hash("warmup")
+    # bcrypt only checks legacy hashes, so a broken bcrypt backend (e.g. an
+    # unpinned bcrypt that passlib 1.7.4 can't load) is logged, not fatal
+    try:
+        pwd_context.handler("bcrypt").set_backend("bcrypt")
+    except Exception:
+        logger.exception("bcrypt backend unavailable; legacy bcrypt logins will fail")
+
+def get_password_hash(password: str):
+    return pwd_context.hash(password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Verify a password, returning (verified, new_hash) where new_hash is set if the stored hash is outdated"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+# Verified against when the username does not exist, so that login takes as
+# long for unknown usernames as for wrong passwords
+DUMMY_HASH = pwd_context.hash("dummy-password-for-timing-equalization")
+
+# Recent verify results, keyed by (username, sha256(password), stored hash)
+_verify_cache = TTLCache(maxsize=4096, ttl=5)
+_verify_cache_lock = threading.Lock()
+
+def _verify_cache_key(username: str, plain_password: str, hashed_password: str):
+    return (username, hashlib.sha256(plain_password.encode()).digest(), hashed_password)
+
+def get_cached_verify_result(username: str, plain_password: str, hashed_password: str):
+    """Return the (verified, new_hash) result of an identical attempt from the last few seconds, or None.
+
+    Cheap enough to call on the event loop, so a repeated login only needs a
+    worker thread when this misses.
+    """
+    key = _verify_cache_key(username, plain_password, hashed_password)
+    with _verify_cache_lock:
+        return _verify_cache.get(key)
+
+def cached_verify_and_update_password(username: str, plain_password: str, hashed_password: str):
+    """Like verify_and_update_password, but reuses the result of an identical attempt from the last few seconds.
+
+    Repeated logins with the same credentials (client retries, or a burst of
+    wrong guesses for one account) then cost one hash instead of one each. The
+    stored hash is part of the key, so changing the password or upgrading the
+    hash starts fresh; the tradeoff is that a SHA-256 of recently tried
+    passwords stays in memory for the TTL. Rate limiting per client is separate.
+    """
+    key = _verify_cache_key(username, plain_password, hashed_password)
+    with _verify_cache_lock:
+        result = _verify_cache.get(key)
+    if result is None:
+        result = verify_and_update_password(plain_password, hashed_password)
+        with _verify_cache_lock:
+            _verify_cache[key] = result
+    return result
+
+def normalize_phone_number(phone_number: str) -> str:
+    """Normalize phone number to E.164 format"""
+    # Remove any non-digit characters
+    phone = _NON_DIGIT.sub('', phone_number)
+    
+    # Format as E.164 standard: +[country code][number]
+    # For simplicity, assuming US/Canada numbers if no country code
+    if not phone.startswith('1') and len(phone) == 10:
+        phone = '1' + phone
+        
+    return '+' + phone
+
+def normalize_phone_batch(phone_numbers: List[str]) -> List[str]:
+    """Normalize a list of phone numbers to E.164 format, stripping them all with one regex pass"""
+    digits = _NON_DIGIT_OR_NEWLINE.sub('', '\n'.join(phone_numbers)).split('\n')
+    if len(digits) != len(phone_numbers):
+        # A number contained a newline (or the list is empty); normalize one at a time
+        return [normalize_phone_number(phone) for phone in phone_numbers]
+    
+    # Same rule as normalize_phone_number: assume US/Canada if no country code
+    return ['+1' + phone if len(phone) == 10 and not phone.startswith('1') else '+' + phone for phone in digits]
\ No newline at end of file
@@ -0,0 +1,17 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_MILES = 3956
+
+def haversine_miles_arr(lat, lon, lats, lons):
+    """Calculate distances in miles from one point to arrays of points (vectorized haversine)"""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lats = np.radians(lats)
+    lons = np.radians(lons)
+    
+    # Haversine formula, evaluated for every point at once
+    dlon = lons - lon1
+    dlat = lats - lat1
+    a = np.sin(dlat/2)**2 + math.cos(lat1) * np.cos(lats) * np.sin(dlon/2)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    return c * EARTH_RADIUS_MILES
\ No newline at end of file
@@ -3,13 +3,16 @@ import re
 import sys
 import os
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+# Same pattern as normalize_phone_number in app/security.py
+_NON_DIGIT = re.compile(r'[^0-9]+', re.ASCII)
 
 # Function to normalize phone numbers to E.164 format
 def normalize_phone_number(phone_number):
     """Normalize phone number to E.164 format"""
     # Remove any non-digit characters
-    phone = re.sub(r'\D', '', phone_number)
+    phone = _NON_DIGIT.sub('', phone_number)
     
     # Format as E.164 standard: +[country code][number]
     # For simplicity, assuming US/Canada numbers if no country code
@@ -33,15 +36,17 @@ def main():
         sys.exit(1)
     
     try:
-        # Get all users
-        cursor.execute("SELECT id, username, phone_number FROM users")
-        users = cursor.fetchall()
-        
-        print(f"Found {len(users)} users in the database")
+        # Stream all users through a server-side cursor instead of loading the
+        # whole table into memory; only the numbers that change are kept
+        users = conn.cursor(name="fix_phone_numbers", cursor_factory=RealDictCursor)
+        users.itersize = 1000
+        users.execute("SELECT id, username, phone_number FROM users")
         
         # Process each user's phone number
-        updates = 0
+        changes = []
+        found = 0
         for user in users:
+            found += 1
             user_id = user['id']
             username = user['username']
             current_phone = user['phone_number']
@@ -51,32 +56,45 @@ def main():
             
             # Update if different
             if normalized_phone != current_phone:
-                print(f"User {username} (ID: {user_id}): {current_phone} -> {normalized_phone}")
-                
-                try:
-                    cursor.execute(
-                        "UPDATE users SET phone_number = %s WHERE id = %s",
-                        (normalized_phone, user_id)
-                    )
-                    updates += 1
-                except Exception as e:
-                    print(f"Error updating user {username}: {e}")
-                    # If there's a duplicate phone number, print more details
-                    if "duplicate key" in str(e).lower():
-                        cursor.execute(
-                            "SELECT username FROM users WHERE phone_number = %s",
-                            (normalized_phone,)
-                        )
-                        existing = cursor.fetchone()
-                        if existing:
-                            print(f"Phone number {normalized_phone} already belongs to user {existing['username']}")
+                changes.append((user_id, username, current_phone, normalized_phone))
             else:
                 print(f"User {username} (ID: {user_id}): Phone number already normalized ({current_phone})")
+        users.close()
+        
+        print(f"Found {found} users in the database")
+        
+        # Find normalized numbers that already belong to another user, since a
+        # single duplicate would make the whole batched UPDATE fail
+        cursor.execute(
+            "SELECT id, username, phone_number FROM users WHERE phone_number = ANY(%s)",
+            ([normalized_phone for _, _, _, normalized_phone in changes],)
+        )
+        owners = {row['phone_number']: row for row in cursor.fetchall()}
+        
+        updates = []
+        for user_id, username, current_phone, normalized_phone in changes:
+            existing = owners.get(normalized_phone)
+            if existing and existing['id'] != user_id:
+                print(f"Error updating user {username}: phone number {normalized_phone} already belongs to user {existing['username']}")
+                continue
+            
+            print(f"User {username} (ID: {user_id}): {current_phone} -> {normalized_phone}")
+            owners[normalized_phone] = {'id': user_id, 'username': username}
+            updates.append((user_id, normalized_phone))
+        
+        # Write all changes with one UPDATE ... FROM (VALUES ...) per 1000 users
+        execute_values(
+            cursor,
+            "UPDATE users SET phone_number = data.pn FROM (VALUES %s) AS data(id, pn) WHERE users.id = data.id",
+            updates,
+            template="(%s, %s)",
+            page_size=1000
+        )
         
         # Commit changes
-        if updates > 0:
+        if updates:
             conn.commit()
-            print(f"Successfully updated {updates} phone numbers")
+            print(f"Successfully updated {len(updates)} phone numbers")
         else:
             print("No phone numbers needed updating")
             
@@ -40,4 +40,26 @@ CREATE TABLE friendships (
     updated_at TIMESTAMPTZ,
     UNIQUE(user_id, friend_id)
 );
-" 
\ No newline at end of file
+" 
+
+# Create the friendships indexes
+psql -U anshviswanathan -d patch_db -c "
+CREATE INDEX ix_friendships_user_id_is_accepted_friend_id ON friendships (user_id, is_accepted, friend_id);
+CREATE INDEX ix_friendships_friend_id_is_accepted ON friendships (friend_id, is_accepted);
+CREATE UNIQUE INDEX ix_friendships_pending_pair ON friendships (LEAST(user_id, friend_id), GREATEST(user_id, friend_id)) WHERE NOT is_accepted;
+"
+
+# Create the trigram index used by user search
+psql -U anshviswanathan -d patch_db -c "CREATE EXTENSION IF NOT EXISTS pg_trgm;"
+psql -U anshviswanathan -d patch_db -c "
+CREATE INDEX users_search_trgm_idx ON users
+USING gin ((username || ' ' || coalesce(first_name, '') || ' ' || coalesce(last_name, '')) gin_trgm_ops);
+"
+
+# Create the generated location column and its GIST index used by nearby-user discovery
+psql -U anshviswanathan -d patch_db -c "CREATE EXTENSION IF NOT EXISTS postgis;"
+psql -U anshviswanathan -d patch_db -c "
+ALTER TABLE users ADD COLUMN location geography(Point,4326)
+GENERATED ALWAYS AS (ST_MakePoint(longitude, latitude)::geography) STORED;
+CREATE INDEX users_location_gix ON users USING GIST (location);
+"
\ No newline at end of file
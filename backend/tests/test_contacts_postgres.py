@@ -0,0 +1,107 @@
+"""Contact lookups against a real PostgreSQL + PostGIS database.
+
+These queries use Postgres-only SQL (unnest, ANY, PostGIS), so they are
+skipped unless TEST_DATABASE_URL points at a disposable database, e.g.:
+
+    TEST_DATABASE_URL=postgresql+asyncpg://localhost/patch_test python -m pytest tests
+
+The tables in that database are dropped and recreated.
+"""
+import asyncio
+import os
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+from sqlalchemy import text
+from app.database import engine, SessionLocal, Base
+from app.models.user import User
+from app.models.friendship import Friendship
+from app.location_buffer import buffer_location, flush_locations
+from app.routers.users import check_contacts, find_nearby_contacts
+from app.schemas.user import ContactsCheck
+
+def run(scenario):
+    """Run a scenario on a fresh schema, then close the pool so the next event loop starts clean"""
+    async def main():
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            async with SessionLocal() as db:
+                return await scenario(db)
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+async def add_user(db, username, phone_number, latitude=None, longitude=None):
+    user = User(
+        username=username,
+        phone_number=phone_number,
+        password="x",
+        latitude=latitude,
+        longitude=longitude
+    )
+    db.add(user)
+    await db.commit()
+    return user
+
+def test_check_contacts_marks_registered_numbers():
+    async def scenario(db):
+        bob = await add_user(db, "bob", "+15557654321")
+        contacts = await check_contacts(
+            ContactsCheck(phone_numbers=["(555) 765-4321", "555-999-9999", "5557654321"]), db
+        )
+        assert contacts == {
+            "+15557654321": {
+                "id": bob.id,
+                "username": "bob",
+                "first_name": None,
+                "last_name": None,
+                "is_registered": True
+            },
+            "+15559999999": {"is_registered": False}
+        }
+    
+    run(scenario)
+
+def test_nearby_contacts_excludes_contacts_and_friends():
+    async def scenario(db):
+        alice = await add_user(db, "alice", "+15550000001", 37.7749, -122.4194)
+        contact = await add_user(db, "bob", "+15550000002", 37.7750, -122.4195)
+        friend = await add_user(db, "carol", "+15550000003", 37.7751, -122.4196)
+        stranger = await add_user(db, "dave", "+15550000004", 37.7760, -122.4200)
+        await add_user(db, "erin", "+15550000005", 40.7128, -74.0060)  # Too far away
+        db.add(Friendship(user_id=alice.id, friend_id=friend.id, is_accepted=True))
+        await db.commit()
+        
+        nearby = await find_nearby_contacts(
+            alice.id, ContactsCheck(phone_numbers=["555-000-0002"]), db
+        )
+        assert [user["id"] for user in nearby] == [stranger.id]
+        assert [shared["id"] for shared in nearby[0]["mutual_contacts"]] == [contact.id]
+    
+    run(scenario)
+
+def test_nearby_contacts_uses_location_not_yet_flushed():
+    async def scenario(db):
+        alice = await add_user(db, "alice", "+15550000001")
+        await add_user(db, "bob", "+15550000002", 37.7750, -122.4195)
+        stranger = await add_user(db, "dave", "+15550000004", 37.7760, -122.4200)
+        
+        # The location update is still buffered, so the stored location is NULL
+        buffer_location(alice.id, 37.7749, -122.4194)
+        try:
+            nearby = await find_nearby_contacts(
+                alice.id, ContactsCheck(phone_numbers=["555-000-0002"]), db
+            )
+        finally:
+            await flush_locations()
+        assert [user["id"] for user in nearby] == [stranger.id]
+    
+    run(scenario)
\ No newline at end of file
@@ -0,0 +1,9 @@
+#!/bin/bash
+
+# Add composite indexes used by the friend list and friend request lookups
+psql -U anshviswanathan -d patch_db -c "
+CREATE INDEX IF NOT EXISTS ix_friendships_user_id_is_accepted ON friendships (user_id, is_accepted);
+CREATE INDEX IF NOT EXISTS ix_friendships_friend_id_is_accepted ON friendships (friend_id, is_accepted);
+"
+
+echo "Added composite indexes to friendships table!"
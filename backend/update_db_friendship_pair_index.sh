@@ -0,0 +1,10 @@
+#!/bin/bash
+
+# Allow at most one pending friend request per pair of users, in either direction,
+# so add_friend can rely on INSERT ... ON CONFLICT DO NOTHING
+psql -U anshviswanathan -d patch_db -c "
+CREATE UNIQUE INDEX IF NOT EXISTS ix_friendships_pending_pair ON friendships
+(LEAST(user_id, friend_id), GREATEST(user_id, friend_id)) WHERE NOT is_accepted;
+"
+
+echo "Added pending friend request pair index to friendships table!"
@@ -0,0 +1,22 @@
+#!/bin/bash
+
+# Databases created by SQLAlchemy's create_all (rather than setup_db.sh) are
+# missing UNIQUE (user_id, friend_id). Drop duplicate rows for a direction,
+# keeping the oldest, then add the constraint.
+psql -U anshviswanathan -d patch_db -c "
+DELETE FROM friendships f
+USING friendships d
+WHERE f.user_id = d.user_id AND f.friend_id = d.friend_id AND f.id > d.id;
+"
+
+psql -U anshviswanathan -d patch_db -c "
+DO \$\$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'friendships_user_id_friend_id_key') THEN
+        ALTER TABLE friendships ADD CONSTRAINT friendships_user_id_friend_id_key UNIQUE (user_id, friend_id);
+    END IF;
+END
+\$\$;
+"
+
+echo "Added unique (user_id, friend_id) constraint to friendships table!"
\ No newline at end of file
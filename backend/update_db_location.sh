@@ -0,0 +1,15 @@
+#!/bin/bash
+
+# Enable PostGIS for geography columns and distance queries
+psql -U anshviswanathan -d patch_db -c "CREATE EXTENSION IF NOT EXISTS postgis;"
+
+# Keep a geography point in sync with latitude/longitude so nearby-user
+# discovery can use a GIST index instead of computing distances in Python
+psql -U anshviswanathan -d patch_db -c "
+ALTER TABLE users ADD COLUMN IF NOT EXISTS location geography(Point,4326)
+GENERATED ALWAYS AS (ST_MakePoint(longitude, latitude)::geography) STORED;
+"
+
+psql -U anshviswanathan -d patch_db -c "CREATE INDEX IF NOT EXISTS users_location_gix ON users USING GIST (location);"
+
+echo "Added location column and index to users table!"
\ No newline at end of file
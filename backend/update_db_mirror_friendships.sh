@@ -0,0 +1,22 @@
+#!/bin/bash
+
+# Accepted friendships are now stored in both directions. Add the missing
+# reverse row for every friendship that was accepted before this change.
+psql -U anshviswanathan -d patch_db -c "
+INSERT INTO friendships (user_id, friend_id, is_accepted)
+SELECT f.friend_id, f.user_id, TRUE
+FROM friendships f
+WHERE f.is_accepted
+AND NOT EXISTS (
+    SELECT 1 FROM friendships r
+    WHERE r.user_id = f.friend_id AND r.friend_id = f.user_id
+);
+"
+
+# Friend lists now filter on user_id alone, so index the friend_id they read as well
+psql -U anshviswanathan -d patch_db -c "
+CREATE INDEX IF NOT EXISTS ix_friendships_user_id_is_accepted_friend_id ON friendships (user_id, is_accepted, friend_id);
+DROP INDEX IF EXISTS ix_friendships_user_id_is_accepted;
+"
+
+echo "Mirrored accepted friendships and updated friendships indexes!"
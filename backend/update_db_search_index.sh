@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# Enable trigram matching so ILIKE '%query%' searches can use an index
+psql -U anshviswanathan -d patch_db -c "CREATE EXTENSION IF NOT EXISTS pg_trgm;"
+
+# Index the same expression that search_users filters on
+psql -U anshviswanathan -d patch_db -c "
+CREATE INDEX IF NOT EXISTS users_search_trgm_idx ON users
+USING gin ((username || ' ' || coalesce(first_name, '') || ' ' || coalesce(last_name, '')) gin_trgm_ops);
+"
+
+echo "Added trigram search index to users table!"